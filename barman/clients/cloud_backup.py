@@ -31,6 +31,7 @@ from barman.clients.cloud_cli import (
     add_tag_argument,
     create_argument_parser,
 )
+from barman.clients.cloud_compression import check_compression_available
 from barman.cloud import (
     CloudBackupSnapshot,
     CloudBackupUploader,
@@ -153,6 +154,7 @@ def main(args=None):
     tempdir = tempfile.mkdtemp(prefix="barman-cloud-backup-")
     try:
         _validate_config(config)
+        check_compression_available(config.compression)
         # Create any temporary file in the `tempdir` subdirectory
         tempfile.tempdir = tempdir
 
@@ -294,6 +296,14 @@ def parse_arguments(args=None):
         const="snappy",
         dest="compression",
     )
+    compression.add_argument(
+        "--snappy-raw",
+        help="snappy-compress the backup while uploading to the cloud, using raw "
+        "snappy blocks without the CRC32C checksums of the snappy framing format",
+        action="store_const",
+        const="snappy-raw",
+        dest="compression",
+    )
     parser.add_argument(
         "-h",
         "--host",
@@ -19,14 +19,42 @@
 import bz2
 import gzip
 import lzma
+import os
 import shutil
+import struct
+import tempfile
 from abc import ABCMeta, abstractmethod
-from io import BytesIO
+from functools import lru_cache
 
 from barman.compression import _try_import_lz4, _try_import_zstd
 from barman.utils import with_metaclass
 
+# Compression level used for zstd, the same default as the zstd utility
+ZSTD_LEVEL = 3
+# Size of the sample used to estimate how compressible a file is before
+# choosing the zstd compression level
+ZSTD_SAMPLE_SIZE = 64 << 10
+# Log2 of the zstd window size. 27 (128 MiB, same as `zstd --long`) is the
+# largest window accepted by zstd decoders without extra configuration.
+ZSTD_WINDOW_LOG = 27
+# Size of the blocks read from the source file when streaming it into
+# a compressor
+COPY_BUFSIZE = 1 << 20
+# Size of the blocks read from a decompressor when writing the decompressed
+# data to the destination file
+DECOMPRESS_BUFSIZE = 4 << 20
+# Maximum size of the compressed data which is kept in memory before
+# spilling it to disk
+SPOOL_MAX_SIZE = 32 << 20
+# Size of the uncompressed blocks used by the snappy-raw format, the same
+# chunk size used by python-snappy for its framing format
+SNAPPY_RAW_BLOCK_SIZE = 64 << 10
+# Header of each snappy-raw block: the length of the compressed block as a
+# 4-byte big-endian integer
+SNAPPY_RAW_HEADER = struct.Struct(">I")
 
+
+@lru_cache(maxsize=1)
 def _try_import_snappy():
     try:
         import snappy
@@ -94,71 +122,289 @@ class SnappyCompressor(ChunkedCompressor):
         return self.decompressor.decompress(data)
 
 
+class SnappyRawCompressor(ChunkedCompressor):
+    """
+    A ChunkedCompressor implementation based on python-snappy raw blocks.
+
+    Every chunk is compressed as an independent snappy block preceded by its
+    compressed length. Unlike the snappy framing format used by
+    SnappyCompressor, no CRC32C checksum of the data is computed.
+    """
+
+    def __init__(self):
+        self.snappy = _try_import_snappy()
+        # Compressed data received by decompress which does not make up
+        # a whole block yet
+        self.pending = bytearray()
+
+    def add_chunk(self, data):
+        """
+        Compresses the supplied data and returns all the compressed bytes.
+
+        :param bytes data: The chunk of data to be compressed
+        :return: The compressed data
+        :rtype: bytes
+        """
+        compressed = self.snappy.compress(data)
+        return SNAPPY_RAW_HEADER.pack(len(compressed)) + compressed
+
+    def decompress(self, data):
+        """
+        Decompresses the supplied chunk of data and returns at least part of the
+        uncompressed data.
+
+        Any trailing incomplete block is kept until the following call supplies
+        the rest of it.
+
+        :param bytes data: The chunk of data to be decompressed
+        :return: The decompressed data
+        :rtype: bytes
+        """
+        self.pending += data
+        blocks = []
+        offset = 0
+        while len(self.pending) - offset >= SNAPPY_RAW_HEADER.size:
+            (length,) = SNAPPY_RAW_HEADER.unpack_from(self.pending, offset)
+            start = offset + SNAPPY_RAW_HEADER.size
+            if len(self.pending) - start < length:
+                break
+            blocks.append(self.snappy.uncompress(self.pending[start : start + length]))
+            offset = start + length
+        del self.pending[:offset]
+        return b"".join(blocks)
+
+
+def _snappy_raw_stream_compress(src, dst):
+    """
+    Compresses the content of the src file-like object into the dst
+    file-like object using the snappy-raw format.
+
+    :param IOBase src: A file-like object containing the data to compress
+    :param IOBase dst: A file-like object receiving the compressed data
+    """
+    compressor = SnappyRawCompressor()
+    while True:
+        block = src.read(SNAPPY_RAW_BLOCK_SIZE)
+        if not block:
+            break
+        dst.write(compressor.add_chunk(block))
+
+
+def _snappy_raw_stream_decompress(src, dst):
+    """
+    Decompresses the snappy-raw content of the src file-like object into the
+    dst file-like object.
+
+    :param IOBase src: A file-like object containing the compressed data
+    :param IOBase dst: A file-like object receiving the decompressed data
+    """
+    decompressor = SnappyRawCompressor()
+    while True:
+        data = src.read(COPY_BUFSIZE)
+        if not data:
+            break
+        dst.write(decompressor.decompress(data))
+    if decompressor.pending:
+        raise ValueError("Truncated snappy-raw data")
+
+
 def get_compressor(compression):
     """
     Helper function which returns a ChunkedCompressor for the specified compression
-    algorithm. Currently only snappy is supported. The other compression algorithms
-    supported by barman cloud use the decompression built into TarFile.
+    algorithm. Currently only snappy and snappy-raw are supported. The other
+    compression algorithms supported by barman cloud use the decompression built
+    into TarFile.
 
-    :param str compression: The compression algorithm to use. Can be set to snappy
-      or any compression supported by the TarFile mode string.
+    :param str compression: The compression algorithm to use. Can be set to snappy,
+      snappy-raw or any compression supported by the TarFile mode string.
     :return: A ChunkedCompressor capable of compressing and decompressing using the
       specified compression.
     :rtype: ChunkedCompressor
     """
     if compression == "snappy":
         return SnappyCompressor()
+    elif compression == "snappy-raw":
+        return SnappyRawCompressor()
     return None
 
 
-def compress(wal_file, compression):
+def check_compression_available(compression):
     """
-    Compresses the supplied wal_file and returns a file-like object containing the
-    compressed data.
+    Makes sure the python module required by the specified compression can be
+    imported.
+
+    This is meant to be called when a command starts, so that a missing module
+    is reported before any data is read or uploaded rather than in the middle
+    of the operation.
+
+    :param str|None compression: The compression algorithm which will be used.
+    :raises SystemExit: If the required python module is missing.
+    """
+    if compression in ("snappy", "snappy-raw"):
+        _try_import_snappy()
+    elif compression == "zstd":
+        _try_import_zstd()
+    elif compression == "lz4":
+        _try_import_lz4()
+
+
+def _get_remaining_size(fileobj):
+    """
+    Returns the number of bytes which are left to be read from a file-like object.
+
+    :param IOBase fileobj: The file-like object
+    :return: The remaining size in bytes, or -1 if it cannot be determined
+    :rtype: int
+    """
+    try:
+        return os.fstat(fileobj.fileno()).st_size - fileobj.tell()
+    except (AttributeError, OSError, ValueError):
+        return -1
+
+
+def _pick_zstd_level(wal_file):
+    """
+    Chooses the zstd compression level for the supplied file.
+
+    The first :data:`ZSTD_SAMPLE_SIZE` bytes of the file are compressed at
+    level 1 to estimate how compressible the content is. Data which does not
+    compress is compressed at level 1, since higher levels only waste CPU on
+    it; anything else uses :data:`ZSTD_LEVEL`, the zstd default level 3. The
+    file position is restored afterwards.
+
+    :param IOBase wal_file: A file-like object containing the data to compress.
+    :return: The compression level to use, either 1 or :data:`ZSTD_LEVEL`
+    :rtype: int
+    """
+    try:
+        position = wal_file.tell()
+    except (AttributeError, OSError):
+        # The sample cannot be read without consuming the file
+        return ZSTD_LEVEL
+    sample = wal_file.read(ZSTD_SAMPLE_SIZE)
+    wal_file.seek(position)
+    if not sample:
+        return ZSTD_LEVEL
+    zstd = _try_import_zstd()
+    ratio = len(sample) / len(zstd.ZstdCompressor(level=1).compress(sample))
+    if ratio < 1.05:
+        return 1
+    return ZSTD_LEVEL
+
+
+def load_zstd_dictionary(path):
+    """
+    Loads a zstd dictionary from the specified file.
+
+    Both dictionaries trained with ``zstd --train`` and raw content
+    dictionaries are accepted.
+
+    :param str path: The path of the file containing the dictionary.
+    :return: The dictionary to be used for compression and decompression
+    :rtype: zstandard.ZstdCompressionDict
+    """
+    zstd = _try_import_zstd()
+    with open(path, "rb") as dict_file:
+        return zstd.ZstdCompressionDict(dict_file.read())
+
+
+def _get_compressed_file():
+    """
+    Returns a new file-like object which will hold compressed data.
+
+    The data is kept in memory as long as it is smaller than
+    :data:`SPOOL_MAX_SIZE`, otherwise it is spilled to a temporary file.
+
+    :rtype: tempfile.SpooledTemporaryFile
+    """
+    return tempfile.SpooledTemporaryFile(
+        max_size=SPOOL_MAX_SIZE, mode="w+b", prefix="barman-cloud-"
+    )
+
+
+def compress_to(wal_file, dest_file, compression, zstd_dictionary=None):
+    """
+    Compresses the supplied wal_file, writing the compressed data into the
+    dest_file file-like object.
+
     :param IOBase wal_file: A file-like object containing the WAL file data.
+    :param IOBase dest_file: A file-like object into which the compressed data
+      should be written.
     :param str compression: The compression algorithm to apply. Can be one of:
-      bzip2, gzip, snappy, zstd, lz4, xz.
-    :return: The compressed data
-    :rtype: BytesIO
+      bzip2, gzip, snappy, snappy-raw, zstd, lz4, xz.
+    :param zstandard.ZstdCompressionDict|None zstd_dictionary: An optional
+      dictionary used to prime the zstd compressor. Ignored by the other
+      compression algorithms.
+    :rtype: None
     """
     if compression == "snappy":
-        in_mem_snappy = BytesIO()
         snappy = _try_import_snappy()
-        snappy.stream_compress(wal_file, in_mem_snappy)
-        in_mem_snappy.seek(0)
-        return in_mem_snappy
+        snappy.stream_compress(wal_file, dest_file)
+    elif compression == "snappy-raw":
+        _snappy_raw_stream_compress(wal_file, dest_file)
     elif compression == "zstd":
-        in_mem_zstd = BytesIO()
         zstd = _try_import_zstd()
-        zstd.ZstdCompressor().copy_stream(wal_file, in_mem_zstd)
-        in_mem_zstd.seek(0)
-        return in_mem_zstd
+        # Use long distance matching over a large window so that repetitions
+        # far apart in the file are found, and let zstd spread the work across
+        # all the available cores: the output is still a single standard frame
+        params = zstd.ZstdCompressionParameters.from_level(
+            _pick_zstd_level(wal_file),
+            window_log=ZSTD_WINDOW_LOG,
+            enable_ldm=True,
+            threads=-1,
+        )
+        # Knowing the input size in advance lets zstd tune its parameters
+        # (e.g. shrink the window for small files)
+        zstd.ZstdCompressor(
+            dict_data=zstd_dictionary, compression_params=params
+        ).copy_stream(wal_file, dest_file, size=_get_remaining_size(wal_file))
     elif compression == "lz4":
         lz4 = _try_import_lz4()
-        in_mem_lz4 = BytesIO(lz4.frame.compress(wal_file.read()))
-        in_mem_lz4.seek(0)
-        return in_mem_lz4
+        # Use the largest block size, so that fewer blocks (and block
+        # headers) are needed for a WAL segment
+        compressor = lz4.frame.LZ4FrameCompressor(block_size=lz4.frame.BLOCKSIZE_MAX4MB)
+        # Stream the data through the compressor, writing each piece of
+        # compressed output as soon as it is returned
+        dest_file.write(compressor.begin())
+        while True:
+            block = wal_file.read(COPY_BUFSIZE)
+            if not block:
+                break
+            dest_file.write(compressor.compress(block))
+        dest_file.write(compressor.flush())
     elif compression == "gzip":
-        # Create a BytesIO for in memory compression
-        in_mem_gzip = BytesIO()
-        with gzip.GzipFile(fileobj=in_mem_gzip, mode="wb") as gz:
-            # copy the gzipped data in memory
-            shutil.copyfileobj(wal_file, gz)
-        in_mem_gzip.seek(0)
-        return in_mem_gzip
+        with gzip.GzipFile(fileobj=dest_file, mode="wb") as gz:
+            shutil.copyfileobj(wal_file, gz, length=COPY_BUFSIZE)
     elif compression == "bzip2":
-        # Create a BytesIO for in memory compression
-        in_mem_bz2 = BytesIO(bz2.compress(wal_file.read()))
-        in_mem_bz2.seek(0)
-        return in_mem_bz2
+        with bz2.BZ2File(dest_file, mode="wb") as bz:
+            shutil.copyfileobj(wal_file, bz, length=COPY_BUFSIZE)
     elif compression == "xz":
-        in_mem_xz = BytesIO(lzma.compress(wal_file.read()))
-        in_mem_xz.seek(0)
-        return in_mem_xz
+        with lzma.LZMAFile(dest_file, mode="wb") as xz:
+            shutil.copyfileobj(wal_file, xz, length=COPY_BUFSIZE)
     else:
         raise ValueError("Unknown compression type: %s" % compression)
 
 
+def compress(wal_file, compression, zstd_dictionary=None):
+    """
+    Compresses the supplied wal_file and returns a file-like object containing the
+    compressed data.
+
+    See :func:`compress_to` for the description of the parameters.
+
+    :param IOBase wal_file: A file-like object containing the WAL file data.
+    :param str compression: The compression algorithm to apply.
+    :param zstandard.ZstdCompressionDict|None zstd_dictionary: An optional
+      dictionary used to prime the zstd compressor.
+    :return: The compressed data, positioned at its beginning
+    :rtype: tempfile.SpooledTemporaryFile
+    """
+    compressed_file = _get_compressed_file()
+    compress_to(wal_file, compressed_file, compression, zstd_dictionary)
+    compressed_file.seek(0)
+    return compressed_file
+
+
 def get_streaming_tar_mode(mode, compression):
     """
     Helper function used in streaming uploads and downloads which appends the supplied
@@ -172,13 +418,13 @@ def get_streaming_tar_mode(mode, compression):
     :return: The full filemode for a streaming tar file
     :rtype: str
     """
-    if compression == "snappy" or compression is None:
+    if compression in ("snappy", "snappy-raw") or compression is None:
         return "%s|" % mode
     else:
         return "%s|%s" % (mode, compression)
 
 
-def decompress_to_file(blob, dest_file, compression):
+def decompress_to_file(blob, dest_file, compression, zstd_dictionary=None):
     """
     Decompresses the supplied blob of data into the dest_file file-like object using
     the specified compression.
@@ -187,16 +433,23 @@ def decompress_to_file(blob, dest_file, compression):
     :param IOBase dest_file: A file-like object into which the uncompressed data
       should be written.
     :param str compression: The compression algorithm to apply. Can be one of:
-      bzip2, gzip, snappy, zstd, lz4, xz.
+      bzip2, gzip, snappy, snappy-raw, zstd, lz4, xz.
+    :param zstandard.ZstdCompressionDict|None zstd_dictionary: The dictionary
+      used when the data was compressed with zstd, if any.
     :rtype: None
     """
     if compression == "snappy":
         snappy = _try_import_snappy()
         snappy.stream_decompress(blob, dest_file)
         return
+    elif compression == "snappy-raw":
+        _snappy_raw_stream_decompress(blob, dest_file)
+        return
     elif compression == "zstd":
         zstd = _try_import_zstd()
-        source_file = zstd.ZstdDecompressor().stream_reader(blob)
+        source_file = zstd.ZstdDecompressor(
+            dict_data=zstd_dictionary, max_window_size=2**ZSTD_WINDOW_LOG
+        ).stream_reader(blob)
     elif compression == "lz4":
         lz4 = _try_import_lz4()
         source_file = lz4.frame.open(blob, mode="rb")
@@ -210,4 +463,4 @@ def decompress_to_file(blob, dest_file, compression):
         raise ValueError("Unknown compression type: %s" % compression)
 
     with source_file:
-        shutil.copyfileobj(source_file, dest_file)
+        shutil.copyfileobj(source_file, dest_file, length=DECOMPRESS_BUFSIZE)
@@ -29,7 +29,11 @@ from barman.clients.cloud_cli import (
     add_tag_argument,
     create_argument_parser,
 )
-from barman.clients.cloud_compression import compress
+from barman.clients.cloud_compression import (
+    check_compression_available,
+    compress,
+    load_zstd_dictionary,
+)
 from barman.cloud import configure_logging
 from barman.cloud_providers import get_cloud_interface
 from barman.exceptions import BarmanException
@@ -79,13 +83,18 @@ def main(args=None):
         raise CLIErrorExit()
 
     try:
+        check_compression_available(config.compression)
         cloud_interface = get_cloud_interface(config)
 
         with closing(cloud_interface):
+            zstd_dictionary = None
+            if config.compression == "zstd" and config.zstd_dictionary:
+                zstd_dictionary = load_zstd_dictionary(config.zstd_dictionary)
             uploader = CloudWalUploader(
                 cloud_interface=cloud_interface,
                 server_name=config.server_name,
                 compression=config.compression,
+                zstd_dictionary=zstd_dictionary,
             )
 
             if not cloud_interface.test_connectivity():
@@ -163,6 +172,15 @@ def parse_arguments(args=None):
         const="snappy",
         dest="compression",
     )
+    compression.add_argument(
+        "--snappy-raw",
+        help="snappy-compress the WAL while uploading to the cloud, using raw "
+        "snappy blocks without the CRC32C checksums of the snappy framing format "
+        "(requires optional python-snappy library)",
+        action="store_const",
+        const="snappy-raw",
+        dest="compression",
+    )
     compression.add_argument(
         "--zstd",
         help="zstd-compress the WAL while uploading to the cloud "
@@ -179,6 +197,13 @@ def parse_arguments(args=None):
         const="lz4",
         dest="compression",
     )
+    parser.add_argument(
+        "--zstd-dictionary",
+        help="path of a zstd dictionary used to prime the compressor. Can only "
+        "be used with --zstd. The same dictionary must be passed to "
+        "barman-cloud-wal-restore in order to restore the WAL.",
+        dest="zstd_dictionary",
+    )
     add_tag_argument(
         parser,
         name="tags",
@@ -238,7 +263,10 @@ def parse_arguments(args=None):
         default="64MB",
         type=check_size,
     )
-    return parser.parse_args(args=args)
+    parsed_args = parser.parse_args(args=args)
+    if parsed_args.zstd_dictionary and parsed_args.compression != "zstd":
+        parser.error("--zstd-dictionary can only be used with --zstd")
+    return parsed_args
 
 
 class CloudWalUploader(object):
@@ -246,7 +274,9 @@ class CloudWalUploader(object):
     Cloud storage upload client
     """
 
-    def __init__(self, cloud_interface, server_name, compression=None):
+    def __init__(
+        self, cloud_interface, server_name, compression=None, zstd_dictionary=None
+    ):
         """
         Object responsible for handling interactions with cloud storage
 
@@ -254,10 +284,13 @@ class CloudWalUploader(object):
           upload the backup
         :param str server_name: The name of the server as configured in Barman
         :param str compression: Compression algorithm to use
+        :param zstandard.ZstdCompressionDict|None zstd_dictionary: Dictionary
+          used to prime the compressor when compression is zstd
         """
 
         self.cloud_interface = cloud_interface
         self.compression = compression
+        self.zstd_dictionary = zstd_dictionary
         self.server_name = server_name
 
     def upload_wal(self, wal_path, override_tags=None):
@@ -293,15 +326,14 @@ class CloudWalUploader(object):
 
         If no compression is required a simple File object is returned.
 
-        In case of compression, a BytesIO object is returned, containing the
-        result of the compression.
+        In case of compression, a SpooledTemporaryFile object is returned,
+        containing the result of the compression.
 
-        NOTE: the Wal files are actually compressed straight into memory,
-        thanks to the usual small dimension of the WAL.
-        This could change in the future because the WAL files dimension could
-        be more than 16MB on some postgres install.
-
-        TODO: Evaluate using tempfile if the WAL is bigger than 16MB
+        NOTE: the WAL files are compressed straight into memory, thanks to the
+        usual small dimension of the WAL. The compressed data is spilled to a
+        temporary file when it grows bigger than
+        barman.clients.cloud_compression.SPOOL_MAX_SIZE, which can happen with
+        WAL segments larger than the default 16MB.
 
         :param str wal_path:
         :return File: simple or compressed file object
@@ -312,7 +344,7 @@ class CloudWalUploader(object):
         if not self.compression:
             return wal_file
 
-        return compress(wal_file, self.compression)
+        return compress(wal_file, self.compression, self.zstd_dictionary)
 
     def retrieve_wal_name(self, wal_path):
         """
@@ -348,6 +380,10 @@ class CloudWalUploader(object):
             # add snappy extension
             return "%s.snappy" % wal_name
 
+        elif self.compression == "snappy-raw":
+            # add snappy-raw extension
+            return "%s.snappy-raw" % wal_name
+
         elif self.compression == "zstd":
             # add zst extension
             return "%s.zst" % wal_name
@@ -28,6 +28,7 @@ from barman.clients.cloud_cli import (
     OperationErrorExit,
     create_argument_parser,
 )
+from barman.clients.cloud_compression import load_zstd_dictionary
 from barman.cloud import ALLOWED_COMPRESSIONS, configure_logging
 from barman.cloud_providers import get_cloud_interface
 from barman.exceptions import BarmanException
@@ -54,8 +55,13 @@ def main(args=None):
         cloud_interface = get_cloud_interface(config)
 
         with closing(cloud_interface):
+            zstd_dictionary = None
+            if config.zstd_dictionary:
+                zstd_dictionary = load_zstd_dictionary(config.zstd_dictionary)
             downloader = CloudWalDownloader(
-                cloud_interface=cloud_interface, server_name=config.server_name
+                cloud_interface=cloud_interface,
+                server_name=config.server_name,
+                zstd_dictionary=zstd_dictionary,
             )
 
             if not cloud_interface.test_connectivity():
@@ -96,6 +102,12 @@ def parse_arguments(args=None):
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "--zstd-dictionary",
+        help="path of the zstd dictionary used by barman-cloud-wal-archive "
+        "when the WAL files were zstd-compressed",
+        dest="zstd_dictionary",
+    )
     parser.add_argument(
         "wal_name",
         help="The value of the '%%f' keyword (according to 'restore_command').",
@@ -112,17 +124,20 @@ class CloudWalDownloader(object):
     Cloud storage download client
     """
 
-    def __init__(self, cloud_interface, server_name):
+    def __init__(self, cloud_interface, server_name, zstd_dictionary=None):
         """
         Object responsible for handling interactions with cloud storage
 
         :param CloudInterface cloud_interface: The interface to use to
           upload the backup
         :param str server_name: The name of the server as configured in Barman
+        :param zstandard.ZstdCompressionDict|None zstd_dictionary: Dictionary
+          used when the WAL files were compressed with zstd
         """
 
         self.cloud_interface = cloud_interface
         self.server_name = server_name
+        self.zstd_dictionary = zstd_dictionary
 
     def download_wal(self, wal_name, wal_dest, no_partial):
         """
@@ -204,7 +219,9 @@ class CloudWalDownloader(object):
             wal_dest,
             "decompressing " + compression if compression else "no compression",
         )
-        self.cloud_interface.download_file(remote_name, wal_dest, compression)
+        self.cloud_interface.download_file(
+            remote_name, wal_dest, compression, self.zstd_dictionary
+        )
 
 
 if __name__ == "__main__":
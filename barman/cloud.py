@@ -77,6 +77,7 @@ ALLOWED_COMPRESSIONS = {
     ".bz2": "bzip2",
     ".xz": "xz",
     ".snappy": "snappy",
+    ".snappy-raw": "snappy-raw",
     ".zst": "zstd",
     ".lz4": "lz4",
 }
@@ -373,6 +374,8 @@ class CloudUploadController(object):
             components.append(".bz2")
         elif self.compression == "snappy":
             components.append(".snappy")
+        elif self.compression == "snappy-raw":
+            components.append(".snappy-raw")
         return "".join(components)
 
     def _get_tar(self, name):
@@ -1133,13 +1136,15 @@ class CloudInterface(with_metaclass(ABCMeta)):
         """
 
     @abstractmethod
-    def download_file(self, key, dest_path, decompress):
+    def download_file(self, key, dest_path, decompress, zstd_dictionary=None):
         """
         Download a file from cloud storage
 
         :param str key: The key identifying the file to download
         :param str dest_path: Where to put the destination file
         :param str|None decompress: Compression scheme to use for decompression
+        :param zstandard.ZstdCompressionDict|None zstd_dictionary: The dictionary
+          used when the file was compressed with zstd, if any
         """
 
     @abstractmethod
@@ -2294,6 +2299,8 @@ class CloudBackupCatalog(KeepManagerMixinCloud):
                         info.compression = "bzip2"
                     elif ext == "tar.snappy":
                         info.compression = "snappy"
+                    elif ext == "tar.snappy-raw":
+                        info.compression = "snappy-raw"
                     else:
                         logging.warning("Skipping unknown extension: %s", ext)
                         continue
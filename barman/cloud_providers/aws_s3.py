@@ -291,13 +291,15 @@ class S3CloudInterface(CloudInterface):
                 for o in objects:
                     yield o.get("Key")
 
-    def download_file(self, key, dest_path, decompress):
+    def download_file(self, key, dest_path, decompress, zstd_dictionary=None):
         """
         Download a file from S3
 
         :param str key: The S3 key to download
         :param str dest_path: Where to put the destination file
         :param str|None decompress: Compression scheme to use for decompression
+        :param zstandard.ZstdCompressionDict|None zstd_dictionary: The dictionary
+          used when the file was compressed with zstd, if any
         """
         # Open the remote file
         obj = self.s3.Object(self.bucket_name, key)
@@ -310,7 +312,7 @@ class S3CloudInterface(CloudInterface):
                 shutil.copyfileobj(remote_file, dest_file)
                 return
 
-            decompress_to_file(remote_file, dest_file, decompress)
+            decompress_to_file(remote_file, dest_file, decompress, zstd_dictionary)
 
     def remote_open(self, key, decompressor=None):
         """
@@ -303,13 +303,15 @@ class AzureCloudInterface(CloudInterface):
         for item in res:
             yield item.name
 
-    def download_file(self, key, dest_path, decompress=None):
+    def download_file(self, key, dest_path, decompress=None, zstd_dictionary=None):
         """
         Download a file from Azure Blob Storage
 
         :param str key: The key to download
         :param str dest_path: Where to put the destination file
         :param str|None decompress: Compression scheme to use for decompression
+        :param zstandard.ZstdCompressionDict|None zstd_dictionary: The dictionary
+          used when the file was compressed with zstd, if any
         """
         obj = self.container_client.download_blob(key)
         with open(dest_path, "wb") as dest_file:
@@ -317,7 +319,7 @@ class AzureCloudInterface(CloudInterface):
                 obj.download_to_stream(dest_file)
                 return
             blob = StreamingBlobIO(obj)
-            decompress_to_file(blob, dest_file, decompress)
+            decompress_to_file(blob, dest_file, decompress, zstd_dictionary)
 
     def remote_open(self, key, decompressor=None):
         """
@@ -191,13 +191,15 @@ class GoogleCloudInterface(CloudInterface):
         logging.debug("dirs {}".format(dirs))
         return objects + dirs
 
-    def download_file(self, key, dest_path, decompress):
+    def download_file(self, key, dest_path, decompress, zstd_dictionary=None):
         """
         Download a file from cloud storage
 
         :param str key: The key identifying the file to download
         :param str dest_path: Where to put the destination file
         :param str|None decompress: Compression scheme to use for decompression
+        :param zstandard.ZstdCompressionDict|None zstd_dictionary: The dictionary
+          used when the file was compressed with zstd, if any
         """
         logging.debug("GCS.download_file")
         blob = storage.Blob(key, self.container_client)
@@ -206,7 +208,7 @@ class GoogleCloudInterface(CloudInterface):
                 self.client.download_blob_to_file(blob, dest_file)
                 return
             with blob.open(mode="rb") as blob_reader:
-                decompress_to_file(blob_reader, dest_file, decompress)
+                decompress_to_file(blob_reader, dest_file, decompress, zstd_dictionary)
 
     def remote_open(self, key, decompressor=None):
         """
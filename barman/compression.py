@@ -29,6 +29,7 @@ import shutil
 from abc import ABCMeta, abstractmethod, abstractproperty
 from contextlib import closing
 from distutils.version import LooseVersion as Version
+from functools import lru_cache
 
 import barman.infofile
 from barman.command_wrappers import Command
@@ -422,6 +423,7 @@ class XZCompressor(InternalCompressor):
         return lzma.open(src, mode="rb")
 
 
+@lru_cache(maxsize=1)
 def _try_import_zstd():
     try:
         import zstandard
@@ -454,6 +456,7 @@ class ZSTDCompressor(InternalCompressor):
         return self._zstd.ZstdDecompressor().stream_reader(open(src, mode="rb"))
 
 
+@lru_cache(maxsize=1)
 def _try_import_lz4():
     try:
         import lz4.frame
@@ -480,7 +483,9 @@ class LZ4Compressor(InternalCompressor):
         self._lz4 = _try_import_lz4()
 
     def _compressor(self, dst):
-        return self._lz4.frame.open(dst, mode="wb")
+        return self._lz4.frame.open(
+            dst, mode="wb", block_size=self._lz4.frame.BLOCKSIZE_MAX4MB
+        )
 
     def _decompressor(self, src):
         return self._lz4.frame.open(src, mode="rb")
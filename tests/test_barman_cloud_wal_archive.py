@@ -20,10 +20,13 @@ import bz2
 import gzip
 import logging
 import os
+import struct
 
+import lz4.frame
 import mock
 import pytest
 import snappy
+import zstandard
 
 from barman.clients import cloud_walarchive
 from barman.clients.cloud_walarchive import CloudWalUploader
@@ -59,6 +62,7 @@ class TestMain(object):
             cloud_interface=cloud_object_interface_mock,
             server_name="test-server",
             compression=None,
+            zstd_dictionary=None,
         )
         cloud_object_interface_mock.setup_bucket.assert_called_once_with()
         uploader_object_mock.upload_wal.assert_called_once_with(
@@ -82,6 +86,7 @@ class TestMain(object):
             cloud_interface=cloud_object_interface_mock,
             server_name="test-server",
             compression=None,
+            zstd_dictionary=None,
         )
         cloud_object_interface_mock.setup_bucket.assert_called_once_with()
         uploader_object_mock.upload_wal.assert_called_once_with(
@@ -105,6 +110,7 @@ class TestMain(object):
             cloud_interface=cloud_object_interface_mock,
             server_name="test-server",
             compression=None,
+            zstd_dictionary=None,
         )
         cloud_object_interface_mock.setup_bucket.assert_called_once_with()
         uploader_object_mock.upload_wal.assert_called_once_with(
@@ -144,6 +150,7 @@ class TestMain(object):
             cloud_interface=cloud_object_interface_mock,
             server_name="test-server",
             compression=None,
+            zstd_dictionary=None,
         )
         cloud_object_interface_mock.test_connectivity.assert_called_once_with()
 
@@ -165,6 +172,7 @@ class TestMain(object):
             cloud_interface=cloud_object_interface_mock,
             server_name="test-server",
             compression=None,
+            zstd_dictionary=None,
         )
         cloud_object_interface_mock.test_connectivity.assert_called_once_with()
 
@@ -190,6 +198,60 @@ class TestMain(object):
             ) in caplog.record_tuples
             assert e.value.code == 1
 
+    @mock.patch("barman.clients.cloud_walarchive.CloudWalUploader")
+    @mock.patch("barman.clients.cloud_walarchive.get_cloud_interface")
+    def test_zstd_dictionary(self, cloud_interface_mock, uploader_mock, tmpdir):
+        """The zstd dictionary is loaded and passed to the uploader."""
+        dictionary_file = tmpdir.join("wal.dict")
+        dictionary_file.write(b"some raw content" * 64, mode="wb")
+
+        cloud_walarchive.main(
+            [
+                "--zstd",
+                "--zstd-dictionary",
+                dictionary_file.strpath,
+                "s3://test-bucket/testfolder",
+                "test-server",
+                "/tmp/000000080000ABFF000000C1",
+            ]
+        )
+
+        uploader_mock.assert_called_once_with(
+            cloud_interface=cloud_interface_mock.return_value,
+            server_name="test-server",
+            compression="zstd",
+            zstd_dictionary=mock.ANY,
+        )
+        zstd_dictionary = uploader_mock.call_args[1]["zstd_dictionary"]
+        assert zstd_dictionary.as_bytes() == b"some raw content" * 64
+
+    @pytest.mark.parametrize("compression_args", ([], ["--gzip"], ["--lz4"]))
+    @mock.patch("barman.clients.cloud_walarchive.load_zstd_dictionary")
+    @mock.patch("barman.clients.cloud_walarchive.CloudWalUploader")
+    @mock.patch("barman.clients.cloud_walarchive.get_cloud_interface")
+    def test_zstd_dictionary_requires_zstd(
+        self,
+        _cloud_interface_mock,
+        uploader_mock,
+        load_zstd_dictionary_mock,
+        compression_args,
+    ):
+        """The zstd dictionary is rejected unless zstd compression is used."""
+        with pytest.raises(SystemExit) as excinfo:
+            cloud_walarchive.main(
+                compression_args
+                + [
+                    "--zstd-dictionary",
+                    "/path/to/wal.dict",
+                    "s3://test-bucket/testfolder",
+                    "test-server",
+                    "/tmp/000000080000ABFF000000C1",
+                ]
+            )
+        assert excinfo.value.code == 3
+        load_zstd_dictionary_mock.assert_not_called()
+        uploader_mock.assert_not_called()
+
     @pytest.mark.parametrize(
         (
             "wal_name",
@@ -498,7 +560,9 @@ class TestWalUploader(object):
         # Check the in memory file received
         assert open_file
         # Decompress on the fly to check content
-        assert gzip.GzipFile(fileobj=open_file).read() == "something".encode("utf-8")
+        assert gzip.GzipFile(fileobj=open_file, mode="rb").read() == "something".encode(
+            "utf-8"
+        )
 
     def test_retrieve_bz2_file_obj(self, tmpdir):
         """
@@ -536,6 +600,83 @@ class TestWalUploader(object):
             open_file.read()
         ) == "something".encode("utf-8")
 
+    def test_retrieve_snappy_raw_file_obj(self, tmpdir):
+        """
+        Test the retrieve_file_obj method with a snappy-raw file
+        """
+        # Setup the WAL
+        source = tmpdir.join("wal_dir/000000080000ABFF000000C1")
+        source.write("something".encode("utf-8"), ensure=True)
+        # Create a simple CloudWalUploader obj
+        uploader = CloudWalUploader(
+            mock.MagicMock(), "test-server", compression="snappy-raw"
+        )
+        open_file = uploader.retrieve_file_obj(source.strpath)
+        # Check the in memory file received
+        assert open_file
+        # Check the length header and decompress the block to check content
+        compressed = open_file.read()
+        assert struct.unpack(">I", compressed[:4])[0] == len(compressed) - 4
+        assert snappy.uncompress(compressed[4:]) == "something".encode("utf-8")
+
+    def test_retrieve_zstd_file_obj(self, tmpdir):
+        """
+        Test the retrieve_file_obj method with a zstd file
+        """
+        # Setup the WAL
+        source = tmpdir.join("wal_dir/000000080000ABFF000000C1")
+        source.write("something".encode("utf-8"), ensure=True)
+        # Create a simple CloudWalUploader obj
+        uploader = CloudWalUploader(mock.MagicMock(), "test-server", compression="zstd")
+        open_file = uploader.retrieve_file_obj(source.strpath)
+        # Check the in memory file received
+        assert open_file
+        # Decompress on the fly to check content
+        assert zstandard.ZstdDecompressor().stream_reader(
+            open_file
+        ).read() == "something".encode("utf-8")
+
+    def test_retrieve_lz4_file_obj(self, tmpdir):
+        """
+        Test the retrieve_file_obj method with a lz4 file
+        """
+        # Setup the WAL
+        source = tmpdir.join("wal_dir/000000080000ABFF000000C1")
+        source.write("something".encode("utf-8"), ensure=True)
+        # Create a simple CloudWalUploader obj
+        uploader = CloudWalUploader(mock.MagicMock(), "test-server", compression="lz4")
+        open_file = uploader.retrieve_file_obj(source.strpath)
+        # Check the in memory file received
+        assert open_file
+        # Check the frame uses the largest block size
+        data = open_file.read()
+        assert lz4.frame.get_frame_info(data)["block_size"] == 4 << 20
+        # Decompress on the fly to check content
+        assert lz4.frame.decompress(data) == "something".encode("utf-8")
+
+    def test_retrieve_zstd_file_obj_with_dictionary(self, tmpdir):
+        """
+        Test the retrieve_file_obj method with a zstd file and a dictionary
+        """
+        # Setup the WAL and the dictionary
+        source = tmpdir.join("wal_dir/000000080000ABFF000000C1")
+        source.write("something".encode("utf-8"), ensure=True)
+        dictionary = zstandard.ZstdCompressionDict(b"some raw content" * 64)
+        # Create a simple CloudWalUploader obj
+        uploader = CloudWalUploader(
+            mock.MagicMock(),
+            "test-server",
+            compression="zstd",
+            zstd_dictionary=dictionary,
+        )
+        open_file = uploader.retrieve_file_obj(source.strpath)
+        # Check the in memory file received
+        assert open_file
+        # Decompress on the fly with the same dictionary to check content
+        assert zstandard.ZstdDecompressor(dict_data=dictionary).stream_reader(
+            open_file
+        ).read() == "something".encode("utf-8")
+
     def test_retrieve_normal_file_name(self):
         """
         Test the retrieve_wal_name method with an uncompressed file
@@ -588,6 +729,20 @@ class TestWalUploader(object):
         assert wal_final_name
         assert wal_final_name == "000000080000ABFF000000C1.snappy"
 
+    def test_retrieve_snappy_raw_file_name(self):
+        """
+        Test the retrieve_wal_name method with snappy-raw compression
+        """
+        # Create a fake source name
+        source = "wal_dir/000000080000ABFF000000C1"
+        uploader = CloudWalUploader(
+            mock.MagicMock(), "test-server", compression="snappy-raw"
+        )
+        wal_final_name = uploader.retrieve_wal_name(source)
+        # Check the file name received
+        assert wal_final_name
+        assert wal_final_name == "000000080000ABFF000000C1.snappy-raw"
+
     @mock.patch("barman.cloud.CloudInterface")
     @mock.patch("barman.clients.cloud_walarchive.CloudWalUploader.retrieve_file_obj")
     def test_upload_wal(self, rfo_mock, cloud_interface_mock):
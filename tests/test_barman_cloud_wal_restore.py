@@ -63,7 +63,12 @@ class TestMain(object):
             ]
         )
         assert caplog.text == ""
-        cloud_interface_mock.download_file.assert_called_once()
+        cloud_interface_mock.download_file.assert_called_once_with(
+            "testfolder/test-server/wals/000000080000ABFF/000000080000ABFF000000C1",
+            "/tmp/000000080000ABFF000000C1",
+            None,
+            None,
+        )
 
     @mock.patch("barman.clients.cloud_walrestore.get_cloud_interface")
     def test_succeeds_if_wal_is_found_partial(self, get_cloud_interface_mock, caplog):
@@ -190,3 +195,32 @@ class TestMain(object):
         assert (
             "Barman cloud WAL restore exception: something went wrong\n" in caplog.text
         )
+
+    @mock.patch("barman.clients.cloud_walrestore.get_cloud_interface")
+    def test_succeeds_with_zstd_dictionary(self, get_cloud_interface_mock, tmpdir):
+        """The zstd dictionary is loaded and passed to download_file."""
+        dictionary_file = tmpdir.join("wal.dict")
+        dictionary_file.write(b"some raw content" * 64, mode="wb")
+        cloud_interface_mock = get_cloud_interface_mock.return_value
+        cloud_interface_mock.path = "testfolder/"
+        cloud_interface_mock.list_bucket.return_value = [
+            "testfolder/test-server/wals/000000080000ABFF/000000080000ABFF000000C1.zst"
+        ]
+        cloud_walrestore.main(
+            [
+                "--zstd-dictionary",
+                dictionary_file.strpath,
+                "s3://test-bucket/testfolder/",
+                "test-server",
+                "000000080000ABFF000000C1",
+                "/tmp/000000080000ABFF000000C1",
+            ]
+        )
+        cloud_interface_mock.download_file.assert_called_once_with(
+            "testfolder/test-server/wals/000000080000ABFF/000000080000ABFF000000C1.zst",
+            "/tmp/000000080000ABFF000000C1",
+            "zstd",
+            mock.ANY,
+        )
+        zstd_dictionary = cloud_interface_mock.download_file.call_args[0][3]
+        assert zstd_dictionary.as_bytes() == b"some raw content" * 64
@@ -17,11 +17,13 @@
 # along with Barman.  If not, see <http://www.gnu.org/licenses/>.
 
 import bz2
+import collections
 import datetime
 import gzip
 import logging
 import os
 import shutil
+import struct
 import sys
 from argparse import Namespace
 from functools import partial
@@ -74,9 +76,72 @@ if sys.version_info.major > 2:
 
 
 try:
-    from queue import Queue
+    from queue import Empty as EmptyQueue
 except ImportError:
-    from Queue import Queue
+    from Queue import Empty as EmptyQueue
+
+
+class _FakeQueue(object):
+    """
+    Minimal single-threaded replacement for the queues used by CloudInterface.
+
+    The tests only ever use the queues from a single thread, so a deque is
+    enough and avoids the locking done by queue.Queue on every operation.
+    """
+
+    def __init__(self):
+        self._items = collections.deque()
+
+    def put(self, item):
+        self._items.append(item)
+
+    def get(self):
+        return self._items.popleft()
+
+    def get_nowait(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise EmptyQueue()
+
+    def empty(self):
+        return not self._items
+
+    def task_done(self):
+        pass
+
+    def join(self):
+        pass
+
+
+# Upload results put in the result queue by the worker processes, out of
+# order, as used by TestCloudInterface.test_retrieve_results
+_RESULT_QUEUE_FIXTURES = (
+    {
+        "key": "test/file",
+        "part_number": 2,
+        "end_time": datetime.datetime(2016, 3, 30, 17, 2, 20),
+        "part": {"ETag": "becb2f30c11b6a2b5c069f3c8a5b798c", "PartNumber": "2"},
+    },
+    {
+        "key": "test/file",
+        "part_number": 1,
+        "end_time": datetime.datetime(2016, 3, 30, 17, 1, 20),
+        "part": {"ETag": "27960aa8b7b851eb0277f0f3f5d15d68", "PartNumber": "1"},
+    },
+    {
+        "key": "test/file",
+        "part_number": 3,
+        "end_time": datetime.datetime(2016, 3, 30, 17, 3, 20),
+        "part": {"ETag": "724a0685c99b457d4ddd93814c2d3e2b", "PartNumber": "3"},
+    },
+    {
+        "key": "test/another_file",
+        "part_number": 1,
+        "end_time": datetime.datetime(2016, 3, 30, 17, 5, 20),
+        "part": {"ETag": "89d4f0341d9091aa21ddf67d3b32c34a", "PartNumber": "1"},
+    },
+)
 
 
 def _tar_helper(content, content_filename):
@@ -101,6 +166,9 @@ def _compression_helper(src, compression):
     if compression == "snappy":
         dest = BytesIO()
         snappy.stream_compress(src, dest)
+    elif compression == "snappy-raw":
+        compressed = snappy.compress(src.read())
+        dest = BytesIO(struct.pack(">I", len(compressed)) + compressed)
     elif compression == "gzip":
         dest = BytesIO()
         with gzip.GzipFile(fileobj=dest, mode="wb") as gz:
@@ -122,14 +190,38 @@ class TestCloudInterface(object):
     only the asynchronous infrastructure is tested.
     """
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
-    def test_uploader_minimal(self, boto_mock):
+    @pytest.fixture
+    def s3_interface_factory(self):
+        """
+        Returns a callable building an S3CloudInterface for a test bucket, with
+        boto3 mocked out. Any keyword argument is passed to the constructor.
+        """
+        with mock.patch("barman.cloud_providers.aws_s3.boto3"):
+            yield partial(
+                S3CloudInterface, url="s3://bucket/path/to/dir", encryption=None
+            )
+
+    @pytest.fixture
+    def async_patches(self):
+        """
+        Patches the CloudInterface methods managing the asynchronous upload
+        infrastructure and returns the mocks of _ensure_async,
+        _handle_async_errors and _retrieve_results.
+        """
+        with mock.patch("barman.cloud.CloudInterface._ensure_async") as ensure_async:
+            with mock.patch(
+                "barman.cloud.CloudInterface._handle_async_errors"
+            ) as handle_async_errors:
+                with mock.patch(
+                    "barman.cloud.CloudInterface._retrieve_results"
+                ) as retrieve_results:
+                    yield ensure_async, handle_async_errors, retrieve_results
+
+    def test_uploader_minimal(self, s3_interface_factory):
         """
         Minimal build of the CloudInterface class
         """
-        cloud_interface = S3CloudInterface(
-            url="s3://bucket/path/to/dir", encryption=None
-        )
+        cloud_interface = s3_interface_factory()
 
         # Asynchronous uploading infrastructure is not initialized when
         # a new instance is created
@@ -140,11 +232,9 @@ class TestCloudInterface(object):
         assert len(cloud_interface.worker_processes) == 0
 
     @mock.patch("barman.cloud.multiprocessing")
-    def test_ensure_async(self, mp):
+    def test_ensure_async(self, mp, s3_interface_factory):
         jobs_count = 30
-        interface = S3CloudInterface(
-            url="s3://bucket/path/to/dir", encryption=None, jobs=jobs_count
-        )
+        interface = s3_interface_factory(jobs=jobs_count)
 
         # Test that the asynchronous uploading infrastructure is getting
         # created
@@ -167,12 +257,12 @@ class TestCloudInterface(object):
         assert not mp.Queue.called
         assert not mp.Process.called
 
-    def test_retrieve_results(self):
-        interface = S3CloudInterface(url="s3://bucket/path/to/dir", encryption=None)
-        interface.queue = Queue()
-        interface.done_queue = Queue()
-        interface.result_queue = Queue()
-        interface.errors_queue = Queue()
+    def test_retrieve_results(self, s3_interface_factory):
+        interface = s3_interface_factory()
+        interface.queue = _FakeQueue()
+        interface.done_queue = _FakeQueue()
+        interface.result_queue = _FakeQueue()
+        interface.errors_queue = _FakeQueue()
 
         # With an empty queue, the parts DB is empty
         interface._retrieve_results()
@@ -188,38 +278,8 @@ class TestCloudInterface(object):
         # Fill the result queue with mock results, and assert that after
         # the refresh the result queue is empty and the parts_db full with
         # ordered results
-        interface.result_queue.put(
-            {
-                "key": "test/file",
-                "part_number": 2,
-                "end_time": datetime.datetime(2016, 3, 30, 17, 2, 20),
-                "part": {"ETag": "becb2f30c11b6a2b5c069f3c8a5b798c", "PartNumber": "2"},
-            }
-        )
-        interface.result_queue.put(
-            {
-                "key": "test/file",
-                "part_number": 1,
-                "end_time": datetime.datetime(2016, 3, 30, 17, 1, 20),
-                "part": {"ETag": "27960aa8b7b851eb0277f0f3f5d15d68", "PartNumber": "1"},
-            }
-        )
-        interface.result_queue.put(
-            {
-                "key": "test/file",
-                "part_number": 3,
-                "end_time": datetime.datetime(2016, 3, 30, 17, 3, 20),
-                "part": {"ETag": "724a0685c99b457d4ddd93814c2d3e2b", "PartNumber": "3"},
-            }
-        )
-        interface.result_queue.put(
-            {
-                "key": "test/another_file",
-                "part_number": 1,
-                "end_time": datetime.datetime(2016, 3, 30, 17, 5, 20),
-                "part": {"ETag": "89d4f0341d9091aa21ddf67d3b32c34a", "PartNumber": "1"},
-            }
-        )
+        for result in _RESULT_QUEUE_FIXTURES:
+            interface.result_queue.put(result)
         interface._retrieve_results()
         assert interface.result_queue.empty()
         assert interface.parts_db == {
@@ -264,7 +324,9 @@ class TestCloudInterface(object):
         }
 
     @mock.patch("barman.cloud.CloudInterface._worker_process_execute_job")
-    def test_worker_process_main(self, worker_process_execute_job_mock):
+    def test_worker_process_main(
+        self, worker_process_execute_job_mock, s3_interface_factory
+    ):
         job_collection = [
             {"job_id": 1, "job_type": "upload_part"},
             {"job_id": 2, "job_type": "upload_part"},
@@ -272,9 +334,9 @@ class TestCloudInterface(object):
             None,
         ]
 
-        interface = S3CloudInterface(url="s3://bucket/path/to/dir", encryption=None)
-        interface.queue = mock.MagicMock()
-        interface.errors_queue = Queue()
+        interface = s3_interface_factory()
+        interface.queue = mock.Mock(spec=["get", "put", "task_done"])
+        interface.errors_queue = _FakeQueue()
         interface.queue.get.side_effect = job_collection
         interface._worker_process_main(0)
 
@@ -320,12 +382,13 @@ class TestCloudInterface(object):
         complete_multipart_upload_mock,
         open_mock,
         unlink_mock,
+        s3_interface_factory,
     ):
         # Unknown job type, no boto functions are being called and
         # an exception is being raised
-        interface = S3CloudInterface(url="s3://bucket/path/to/dir", encryption=None)
-        interface.result_queue = Queue()
-        interface.done_queue = Queue()
+        interface = s3_interface_factory()
+        interface.result_queue = _FakeQueue()
+        interface.done_queue = _FakeQueue()
         with pytest.raises(ValueError):
             interface._worker_process_execute_job({"job_type": "error"}, 1)
         assert upload_part_mock.call_count == 0
@@ -382,17 +445,17 @@ class TestCloudInterface(object):
             "status": "done",
         }
 
-    def test_handle_async_errors(self):
+    def test_handle_async_errors(self, s3_interface_factory):
         # If we the upload process has already raised an error, we immediately
         # exit without doing anything
-        interface = S3CloudInterface(url="s3://bucket/path/to/dir", encryption=None)
+        interface = s3_interface_factory()
         interface.error = "test"
         interface.errors_queue = None  # If get called raises AttributeError
         interface._handle_async_errors()
 
         # There is no error and the process haven't already errored out
         interface.error = None
-        interface.errors_queue = Queue()
+        interface.errors_queue = _FakeQueue()
         interface._handle_async_errors()
         assert interface.error is None
 
@@ -403,22 +466,26 @@ class TestCloudInterface(object):
             interface._handle_async_errors()
 
     @mock.patch("barman.cloud.NamedTemporaryFile")
-    @mock.patch("barman.cloud.CloudInterface._handle_async_errors")
-    @mock.patch("barman.cloud.CloudInterface._ensure_async")
     def test_async_upload_part(
-        self, ensure_async_mock, handle_async_errors_mock, temp_file_mock
+        self, temp_file_mock, async_patches, s3_interface_factory
     ):
+        (
+            ensure_async_mock,
+            handle_async_errors_mock,
+            retrieve_results_mock,
+        ) = async_patches
         temp_name = "tmp_file"
         temp_stream = temp_file_mock.return_value.__enter__.return_value
         temp_stream.name = temp_name
 
-        interface = S3CloudInterface(url="s3://bucket/path/to/dir", encryption=None)
-        interface.queue = Queue()
+        interface = s3_interface_factory()
+        interface.queue = _FakeQueue()
         interface.async_upload_part(
             {"UploadId": "upload_id"}, "test/key", BytesIO(b"test"), 1
         )
         ensure_async_mock.assert_called_once_with()
         handle_async_errors_mock.assert_called_once_with()
+        retrieve_results_mock.assert_not_called()
         assert not interface.queue.empty()
         assert interface.queue.get() == {
             "job_type": "upload_part",
@@ -428,14 +495,14 @@ class TestCloudInterface(object):
             "part_number": 1,
         }
 
-    @mock.patch("barman.cloud.CloudInterface._retrieve_results")
-    @mock.patch("barman.cloud.CloudInterface._handle_async_errors")
-    @mock.patch("barman.cloud.CloudInterface._ensure_async")
-    def test_async_complete_multipart_upload(
-        self, ensure_async_mock, handle_async_errors_mock, retrieve_results_mock
-    ):
-        interface = S3CloudInterface(url="s3://bucket/path/to/dir", encryption=None)
-        interface.queue = mock.MagicMock()
+    def test_async_complete_multipart_upload(self, async_patches, s3_interface_factory):
+        (
+            ensure_async_mock,
+            handle_async_errors_mock,
+            retrieve_results_mock,
+        ) = async_patches
+        interface = s3_interface_factory()
+        interface.queue = mock.Mock(spec=["put"])
         interface.parts_db = {"key": ["part", "list"]}
 
         def retrieve_results_effect():
@@ -463,9 +530,17 @@ class TestS3CloudInterface(object):
     Tests which verify backend-specific behaviour of S3CloudInterface.
     """
 
+    @pytest.fixture(autouse=True)
+    def boto_mock(self):
+        """
+        Mocks out boto3 for every test in the class. Tests which need to inspect
+        the mock can request it by name.
+        """
+        with mock.patch("barman.cloud_providers.aws_s3.boto3") as boto_mock:
+            yield boto_mock
+
     @mock.patch("barman.cloud_providers.aws_s3.Config")
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
-    def test_uploader_minimal(self, boto_mock, config_mock):
+    def test_uploader_minimal(self, config_mock, boto_mock):
         # GIVEN an s3 bucket url
         bucket_url = "s3://bucket/path/to/dir"
 
@@ -493,8 +568,7 @@ class TestS3CloudInterface(object):
         assert cloud_interface.s3 == session_mock.resource.return_value
 
     @mock.patch("barman.cloud_providers.aws_s3.Config")
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
-    def test_uploader_minimal_read_timeout(self, boto_mock, config_mock):
+    def test_uploader_minimal_read_timeout(self, config_mock, boto_mock):
         # GIVEN an s3 bucket url
         bucket_url = "s3://bucket/path/to/dir"
 
@@ -518,8 +592,7 @@ class TestS3CloudInterface(object):
             config=config_mock.return_value,
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
-    def test_invalid_uploader_minimal(self, boto_mock):
+    def test_invalid_uploader_minimal(self):
         """
         Minimal build of the CloudInterface class
         """
@@ -529,7 +602,6 @@ class TestS3CloudInterface(object):
             S3CloudInterface("/bucket/path/to/dir", encryption=None)
         assert str(excinfo.value) == "Invalid s3 URL address: /bucket/path/to/dir"
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_connectivity(self, boto_mock):
         """
         test the  test_connectivity method
@@ -541,7 +613,6 @@ class TestS3CloudInterface(object):
         client_mock = s3_mock.meta.client
         client_mock.head_bucket.assert_called_once_with(Bucket="bucket")
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_connectivity_failure(self, boto_mock):
         """
         test the test_connectivity method in case of failure
@@ -556,7 +627,6 @@ class TestS3CloudInterface(object):
         )
         assert cloud_interface.test_connectivity() is False
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_setup_bucket(self, boto_mock):
         """
         Test if a bucket already exists
@@ -571,7 +641,6 @@ class TestS3CloudInterface(object):
             Bucket=cloud_interface.bucket_name
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_setup_bucket_create(self, boto_mock):
         """
         Test auto-creation of a bucket if it not exists
@@ -591,7 +660,6 @@ class TestS3CloudInterface(object):
         # Expect the create() method of the bucket object to be called
         bucket_mock.return_value.create.assert_called_once()
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_upload_fileobj(self, boto_mock):
         """
         Tests synchronous file upload with boto3
@@ -630,7 +698,6 @@ class TestS3CloudInterface(object):
             ),
         ],
     )
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_upload_fileobj_with_encryption(
         self, boto_mock, encryption_args, expected_extra_args
     ):
@@ -672,7 +739,6 @@ class TestS3CloudInterface(object):
             ),
         ],
     )
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_upload_fileobj_with_tags(
         self, boto_mock, cloud_interface_tags, override_tags, expected_tagging
     ):
@@ -705,7 +771,6 @@ class TestS3CloudInterface(object):
             Config=cloud_interface.config,
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_create_multipart_upload(self, boto_mock):
         """
         Tests creation of a multipart upload with boto3
@@ -740,7 +805,6 @@ class TestS3CloudInterface(object):
             ),
         ],
     )
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_create_multipart_upload_with_encryption(
         self, boto_mock, encryption_args, expected_extra_args
     ):
@@ -761,7 +825,6 @@ class TestS3CloudInterface(object):
             Bucket="bucket", Key=mock_key, **expected_extra_args
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_create_multipart_upload_with_tags(self, boto_mock):
         """
         Tests the Tagging argument is provided to boto3 when creating
@@ -781,7 +844,6 @@ class TestS3CloudInterface(object):
             Bucket="bucket", Key=mock_key, Tagging="foo=bar&baz+%2B%25=qux+%25%2F"
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_upload_part(self, boto_mock):
         """
         Tests upload of a single part of a boto3 multipart request
@@ -804,7 +866,6 @@ class TestS3CloudInterface(object):
             PartNumber=1,
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_complete_multipart_upload(self, boto_mock):
         """
         Tests completion of a boto3 multipart request
@@ -826,7 +887,6 @@ class TestS3CloudInterface(object):
             MultipartUpload={"Parts": [{"PartNumber": 1}]},
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_abort_multipart_upload(self, boto_mock):
         """
         Tests upload of a single part of a boto3 multipart request
@@ -846,7 +906,6 @@ class TestS3CloudInterface(object):
             UploadId=mock_metadata["UploadId"],
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_delete_objects(self, boto_mock):
         """
         Tests the successful deletion of a list of objects
@@ -870,7 +929,6 @@ class TestS3CloudInterface(object):
             },
         )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_delete_objects_with_empty_list(self, boto_mock):
         """
         Tests the successful deletion of an empty list of objects
@@ -902,7 +960,6 @@ class TestS3CloudInterface(object):
             (2000, None, 1000),
         ),
     )
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_delete_objects_multiple_batches(
         self, boto_mock, total_objects, requested_batch_size, expected_batch_size
     ):
@@ -948,7 +1005,6 @@ class TestS3CloudInterface(object):
                 },
             )
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_delete_objects_partial_failure(self, boto_mock, caplog):
         """
         Tests that an exception is raised if there are any failures in the response
@@ -984,8 +1040,9 @@ class TestS3CloudInterface(object):
         ) in caplog.text
 
     @pytest.mark.skipif(sys.version_info < (3, 0), reason="Requires Python 3 or higher")
-    @pytest.mark.parametrize("compression", (None, "bzip2", "gzip", "snappy"))
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
+    @pytest.mark.parametrize(
+        "compression", (None, "bzip2", "gzip", "snappy", "snappy-raw")
+    )
     def test_download_file(self, boto_mock, compression, tmpdir):
         """Verifies that cloud_interface.download_file decompresses correctly."""
         dest_path = os.path.join(str(tmpdir), "downloaded_file")
@@ -1016,9 +1073,14 @@ class TestS3CloudInterface(object):
 
     @pytest.mark.parametrize(
         ("compression", "file_ext"),
-        ((None, ""), ("bzip2", ".bz2"), ("gzip", ".gz"), ("snappy", ".snappy")),
+        (
+            (None, ""),
+            ("bzip2", ".bz2"),
+            ("gzip", ".gz"),
+            ("snappy", ".snappy"),
+            ("snappy-raw", ".snappy-raw"),
+        ),
     )
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_extract_tar(self, boto_mock, compression, file_ext, tmpdir):
         """Verifies that cloud_interface.extract_tar decompresses correctly."""
         # GIVEN A tar file containing a single file containing a string
@@ -1115,7 +1177,6 @@ class TestS3CloudInterface(object):
             ),
         ),
     )
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_list_bucket(self, boto_mock, mock_page_data, expected_values):
         """
         Verify that list_bucket returns bucket content in the expected format.
@@ -1174,7 +1235,6 @@ class TestS3CloudInterface(object):
             "wals/0000000200000001/",
         ]
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_delete_under_prefix(self, boto_mock):
         """Verify delete_under_prefix succeeds."""
         # GIVEN a mock s3 bucket which responds successfully to all deletions
@@ -1200,7 +1260,6 @@ class TestS3CloudInterface(object):
         # AND the objects were filtered with the prefix
         bucket_mock.objects.filter.assert_called_once_with(Prefix=prefix)
 
-    @mock.patch("barman.cloud_providers.aws_s3.boto3")
     def test_delete_under_prefix_errors(self, boto_mock):
         """Verify delete_under_prefix fails if any responses are not 200."""
         # GIVEN a mock s3 bucket which responds successfully to all deletions
@@ -1277,28 +1336,69 @@ class TestAzureCloudInterface(object):
             "max_single_put_size": 4 << 20,
         }
 
-    @mock.patch.dict(
-        os.environ,
-        {
-            "AZURE_STORAGE_CONNECTION_STRING": "connection_string",
-            "AZURE_STORAGE_SAS_TOKEN": "sas_token",
-            "AZURE_STORAGE_KEY": "storage_key",
-        },
+    @pytest.mark.parametrize(
+        ("env", "expected_credential"),
+        (
+            # Connection string auth takes precedence over SAS token or shared token
+            (
+                {
+                    "AZURE_STORAGE_CONNECTION_STRING": "connection_string",
+                    "AZURE_STORAGE_SAS_TOKEN": "sas_token",
+                    "AZURE_STORAGE_KEY": "storage_key",
+                },
+                "connection_string",
+            ),
+            # SAS token takes precedence over shared token
+            (
+                {
+                    "AZURE_STORAGE_SAS_TOKEN": "sas_token",
+                    "AZURE_STORAGE_KEY": "storage_key",
+                },
+                "sas_token",
+            ),
+            # Shared token is used if SAS token and connection string aren't set
+            ({"AZURE_STORAGE_KEY": "storage_key"}, "storage_key"),
+            # Uses DefaultAzureCredential if no other auth provided
+            ({}, "default_credential"),
+        ),
     )
+    @mock.patch("azure.identity.DefaultAzureCredential")
+    @mock.patch("barman.cloud_providers.azure_blob_storage.requests.Session")
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
-    def test_uploader_minimal(
-        self, container_client_mock, mock_storage_url, mock_object_path
+    def test_uploader_auth(
+        self,
+        container_client_mock,
+        mock_session,
+        default_azure_credential,
+        env,
+        expected_credential,
+        mock_account_url,
+        mock_storage_url,
+        mock_object_path,
+        default_azure_client_args,
     ):
-        """Connection string auth takes precedence over SAS token or shared token"""
+        """The credential is picked from the environment in order of precedence"""
         container_name = "container"
-        cloud_interface = AzureCloudInterface(url=mock_storage_url)
+        with mock.patch.dict(os.environ, env, clear=True):
+            cloud_interface = AzureCloudInterface(url=mock_storage_url)
 
         assert cloud_interface.bucket_name == "container"
         assert cloud_interface.path == mock_object_path
-        container_client_mock.from_connection_string.assert_called_once_with(
-            conn_str=os.environ["AZURE_STORAGE_CONNECTION_STRING"],
-            container_name=container_name,
-        )
+        if expected_credential == "connection_string":
+            container_client_mock.from_connection_string.assert_called_once_with(
+                conn_str="connection_string",
+                container_name=container_name,
+            )
+        else:
+            if expected_credential == "default_credential":
+                expected_credential = default_azure_credential.return_value
+            container_client_mock.assert_called_once_with(
+                account_url=mock_account_url,
+                credential=expected_credential,
+                container_name=container_name,
+                session=mock_session.return_value,
+                **default_azure_client_args,
+            )
 
     @mock.patch.dict(
         os.environ,
@@ -1307,6 +1407,7 @@ class TestAzureCloudInterface(object):
             "AZURE_STORAGE_SAS_TOKEN": "sas_token",
             "AZURE_STORAGE_KEY": "storage_key",
         },
+        clear=True,
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.requests.Session")
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
@@ -1337,100 +1438,12 @@ class TestAzureCloudInterface(object):
             **default_azure_client_args,
         )
 
-    @mock.patch.dict(
-        os.environ,
-        {"AZURE_STORAGE_SAS_TOKEN": "sas_token", "AZURE_STORAGE_KEY": "storage_key"},
-    )
-    @mock.patch("barman.cloud_providers.azure_blob_storage.requests.Session")
-    @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
-    def test_uploader_sas_token_auth(
-        self,
-        container_client_mock,
-        mock_session,
-        mock_account_url,
-        mock_storage_url,
-        mock_object_path,
-        default_azure_client_args,
-    ):
-        """SAS token takes precedence over shared token"""
-        container_name = "container"
-        cloud_interface = AzureCloudInterface(
-            mock_storage_url,
-        )
-
-        assert cloud_interface.bucket_name == "container"
-        assert cloud_interface.path == mock_object_path
-        container_client_mock.assert_called_once_with(
-            account_url=mock_account_url,
-            credential=os.environ["AZURE_STORAGE_SAS_TOKEN"],
-            container_name=container_name,
-            session=mock_session.return_value,
-            **default_azure_client_args,
-        )
-
-    @mock.patch.dict(
-        os.environ,
-        {"AZURE_STORAGE_KEY": "storage_key"},
-    )
-    @mock.patch("barman.cloud_providers.azure_blob_storage.requests.Session")
-    @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
-    def test_uploader_shared_token_auth(
-        self,
-        container_client_mock,
-        mock_session,
-        mock_account_url,
-        mock_storage_url,
-        mock_object_path,
-        default_azure_client_args,
-    ):
-        """Shared token is used if SAS token and connection string aren't set"""
-        container_name = "container"
-        cloud_interface = AzureCloudInterface(url=mock_storage_url)
-
-        assert cloud_interface.bucket_name == "container"
-        assert cloud_interface.path == mock_object_path
-        container_client_mock.assert_called_once_with(
-            account_url=mock_account_url,
-            credential=os.environ["AZURE_STORAGE_KEY"],
-            container_name=container_name,
-            session=mock_session.return_value,
-            **default_azure_client_args,
-        )
-
-    @mock.patch("azure.identity.DefaultAzureCredential")
-    @mock.patch("barman.cloud_providers.azure_blob_storage.requests.Session")
-    @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
-    def test_uploader_default_credential_auth(
-        self,
-        container_client_mock,
-        mock_session,
-        default_azure_credential,
-        mock_account_url,
-        mock_storage_url,
-        mock_object_path,
-        default_azure_client_args,
-    ):
-        """Uses DefaultAzureCredential if no other auth provided"""
-        container_name = "container"
-        cloud_interface = AzureCloudInterface(
-            url=mock_storage_url,
-        )
-
-        assert cloud_interface.bucket_name == "container"
-        assert cloud_interface.path == mock_object_path
-        container_client_mock.assert_called_once_with(
-            account_url=mock_account_url,
-            credential=default_azure_credential.return_value,
-            container_name=container_name,
-            session=mock_session.return_value,
-            **default_azure_client_args,
-        )
-
     @mock.patch.dict(
         os.environ,
         {
             "AZURE_STORAGE_CONNECTION_STRING": "connection_string",
         },
+        clear=True,
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_emulated_storage(self, container_client_mock, mock_object_path):
@@ -1452,6 +1465,7 @@ class TestAzureCloudInterface(object):
     @mock.patch.dict(
         os.environ,
         {"AZURE_STORAGE_SAS_TOKEN": "sas_token", "AZURE_STORAGE_KEY": "storage_key"},
+        clear=True,
     )
     def test_emulated_storage_no_connection_string(self, mock_object_path):
         """Emulated storage URL with no connection string fails"""
@@ -1467,7 +1481,7 @@ class TestAzureCloudInterface(object):
         )
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     def test_uploader_malformed_urls(self):
         url = "https://not.the.azure.domain/container"
@@ -1481,7 +1495,7 @@ class TestAzureCloudInterface(object):
         assert str(exc.value) == "azure blob storage URL %s is malformed" % url
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_connectivity(self, container_client_mock):
@@ -1503,7 +1517,7 @@ class TestAzureCloudInterface(object):
         assert cloud_interface.test_connectivity() is True
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_connectivity_failure(self, container_client_mock):
@@ -1519,7 +1533,7 @@ class TestAzureCloudInterface(object):
         assert cloud_interface.test_connectivity() is False
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_setup_bucket(self, container_client_mock):
@@ -1536,7 +1550,7 @@ class TestAzureCloudInterface(object):
         blobs_iterator.next.assert_called_once_with()
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_setup_bucket_create(self, container_client_mock):
@@ -1555,7 +1569,7 @@ class TestAzureCloudInterface(object):
         container_client.create_container.assert_called_once_with()
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_upload_fileobj(self, container_client_mock, mock_fileobj):
@@ -1576,7 +1590,7 @@ class TestAzureCloudInterface(object):
         )
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_upload_fileobj_with_encryption_scope(
@@ -1620,7 +1634,7 @@ class TestAzureCloudInterface(object):
         ],
     )
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_upload_fileobj_with_tags(
@@ -1656,7 +1670,7 @@ class TestAzureCloudInterface(object):
         )
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_upload_part(self, container_client_mock):
@@ -1679,7 +1693,7 @@ class TestAzureCloudInterface(object):
         blob_client_mock.stage_block.assert_called_once_with("00001", mock_body)
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_upload_part_with_encryption_scope(self, container_client_mock):
@@ -1708,7 +1722,7 @@ class TestAzureCloudInterface(object):
         )
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_complete_multipart_upload(self, container_client_mock):
@@ -1729,7 +1743,7 @@ class TestAzureCloudInterface(object):
         blob_client_mock.commit_block_list.assert_called_once_with(["00001"])
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_complete_multipart_upload_with_encryption_scope(
@@ -1759,7 +1773,7 @@ class TestAzureCloudInterface(object):
         )
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_complete_multipart_upload_with_tags(self, container_client_mock):
@@ -1787,7 +1801,7 @@ class TestAzureCloudInterface(object):
         )
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_abort_multipart_upload(self, container_client_mock):
@@ -1808,7 +1822,7 @@ class TestAzureCloudInterface(object):
         blob_client_mock.delete_blob.assert_called_once_with()
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_abort_multipart_upload_with_encryption_scope(self, container_client_mock):
@@ -1837,7 +1851,7 @@ class TestAzureCloudInterface(object):
         blob_client_mock.delete_blob.assert_called_once_with()
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_delete_objects(self, container_client_mock):
@@ -1852,7 +1866,7 @@ class TestAzureCloudInterface(object):
         container_client.delete_blobs.assert_called_once_with(*mock_keys)
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_delete_objects_with_empty_list(self, container_client_mock):
@@ -1884,7 +1898,7 @@ class TestAzureCloudInterface(object):
         ),
     )
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_delete_objects_multiple_batches(
@@ -1932,7 +1946,7 @@ class TestAzureCloudInterface(object):
         return htr
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_delete_objects_partial_failure(self, container_client_mock, caplog):
@@ -1963,7 +1977,7 @@ class TestAzureCloudInterface(object):
         ) in caplog.text
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_delete_objects_partial_failure_exception(
@@ -2005,7 +2019,7 @@ class TestAzureCloudInterface(object):
         ) in caplog.text
 
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_delete_objects_404_not_failure(self, container_client_mock, caplog):
@@ -2037,9 +2051,11 @@ class TestAzureCloudInterface(object):
         ) in caplog.text
 
     @pytest.mark.skipif(sys.version_info < (3, 0), reason="Requires Python 3 or higher")
-    @pytest.mark.parametrize("compression", (None, "bzip2", "gzip", "snappy"))
+    @pytest.mark.parametrize(
+        "compression", (None, "bzip2", "gzip", "snappy", "snappy-raw")
+    )
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_download_file(self, container_client_mock, compression, tmpdir):
@@ -2086,10 +2102,16 @@ class TestAzureCloudInterface(object):
 
     @pytest.mark.parametrize(
         ("compression", "file_ext"),
-        ((None, ""), ("bzip2", ".bz2"), ("gzip", ".gz"), ("snappy", ".snappy")),
+        (
+            (None, ""),
+            ("bzip2", ".bz2"),
+            ("gzip", ".gz"),
+            ("snappy", ".snappy"),
+            ("snappy-raw", ".snappy-raw"),
+        ),
     )
     @mock.patch.dict(
-        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}
+        os.environ, {"AZURE_STORAGE_CONNECTION_STRING": "connection_string"}, clear=True
     )
     @mock.patch("barman.cloud_providers.azure_blob_storage.ContainerClient")
     def test_extract_tar(self, container_client_mock, compression, file_ext, tmpdir):
@@ -2238,7 +2260,9 @@ class TestGoogleCloudInterface(TestCase):
                     GoogleCloudInterface(url=test["url"])
                 assert str(exc.value) == test["message"]
 
-    @mock.patch.dict(os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "credentials_path"})
+    @mock.patch.dict(
+        os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "credentials_path"}, clear=True
+    )
     @mock.patch("barman.cloud_providers.google_cloud_storage.storage.Client")
     def test_connectivity(self, gcs_client_mock):
         """
@@ -2252,7 +2276,9 @@ class TestGoogleCloudInterface(TestCase):
         container_client_mock = service_client_mock.bucket.return_value
         container_client_mock.exists.assert_called_once_with()
 
-    @mock.patch.dict(os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "credentials_path"})
+    @mock.patch.dict(
+        os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "credentials_path"}, clear=True
+    )
     @mock.patch("barman.cloud_providers.google_cloud_storage.storage.Client")
     def test_connectivity_failure(self, gcs_client_mock):
         """
@@ -2610,6 +2636,7 @@ class TestGoogleCloudInterface(TestCase):
                             blob_mock.open().__enter__(),
                             opened_dest_file,
                             test_case["compression"],
+                            None,
                         )
 
     @mock.patch("barman.cloud_providers.google_cloud_storage.storage")
@@ -3405,7 +3432,7 @@ class TestCloudTarUploader(object):
         "compression",
         # The CloudTarUploader expects the short form compression args set by the
         # cloud_backup argument parser
-        (None, "bz2", "gz", "snappy"),
+        (None, "bz2", "gz", "snappy", "snappy-raw"),
     )
     @mock.patch("barman.cloud.CloudInterface")
     def test_add(self, mock_cloud_interface, compression, tmpdir):
@@ -3451,6 +3478,16 @@ class TestCloudTarUploader(object):
                 tar_fileobj = BytesIO()
                 snappy.stream_decompress(uploaded_data, tar_fileobj)
                 tar_fileobj.seek(0)
+            elif compression == "snappy-raw":
+                tar_mode = "r|"
+                # Decode the length-prefixed snappy blocks before extracting
+                tar_fileobj = BytesIO()
+                header = uploaded_data.read(4)
+                while header:
+                    (length,) = struct.unpack(">I", header)
+                    tar_fileobj.write(snappy.uncompress(uploaded_data.read(length)))
+                    header = uploaded_data.read(4)
+                tar_fileobj.seek(0)
             else:
                 tar_mode = "r|%s" % compression
             with open_tar(fileobj=tar_fileobj, mode=tar_mode) as tf:
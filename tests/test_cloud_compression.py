@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2013-2025
+#
+# This file is part of Barman.
+#
+# Barman is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Barman is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Barman.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+from io import BytesIO
+
+import mock
+import pytest
+import zstandard
+
+from barman.clients.cloud_compression import (
+    ZSTD_LEVEL,
+    ZSTD_SAMPLE_SIZE,
+    _pick_zstd_level,
+    check_compression_available,
+    compress_to,
+    decompress_to_file,
+    load_zstd_dictionary,
+)
+
+
+class TestCompressTo(object):
+    """
+    Tests for the compression of WAL files
+    """
+
+    @pytest.mark.parametrize(
+        "compression", ("bzip2", "gzip", "lz4", "snappy", "snappy-raw", "xz", "zstd")
+    )
+    def test_compress_to_round_trip(self, compression):
+        """
+        Verifies data compressed with compress_to is restored by decompress_to_file.
+        """
+        # GIVEN some content spanning several compression blocks
+        content = b"some WAL content " * (1 << 16)
+        # WHEN it is compressed into a destination file
+        compressed_file = BytesIO()
+        compress_to(BytesIO(content), compressed_file, compression)
+        # THEN the compressed data is smaller than the content
+        assert 0 < compressed_file.tell() < len(content)
+        # AND decompressing it gives back the original content
+        compressed_file.seek(0)
+        dest_file = BytesIO()
+        decompress_to_file(compressed_file, dest_file, compression)
+        assert dest_file.getvalue() == content
+
+    def test_compress_to_zstd_frame_parameters(self, tmpdir):
+        """
+        Verifies zstd records the size of a file in the frame and uses a
+        larger window than the default for its level.
+        """
+        # GIVEN a file larger than the default level 3 window
+        content = b"some WAL content " * (1 << 18)
+        wal_path = tmpdir.join("000000010000000000000001")
+        wal_path.write(content, mode="wb")
+        # WHEN it is compressed with zstd
+        compressed_file = BytesIO()
+        with open(wal_path.strpath, "rb") as wal_file:
+            compress_to(wal_file, compressed_file, "zstd")
+        # THEN the frame records the size of the file
+        params = zstandard.get_frame_parameters(compressed_file.getvalue())
+        assert params.content_size == len(content)
+        # AND its window is larger than the default one for the same level
+        default_params = zstandard.get_frame_parameters(
+            zstandard.ZstdCompressor(level=3).compress(content)
+        )
+        assert params.window_size > default_params.window_size
+
+    def test_compress_to_unknown_compression(self):
+        """
+        Verifies an unknown compression is rejected.
+        """
+        with pytest.raises(ValueError, match="Unknown compression type: foo"):
+            compress_to(BytesIO(b"content"), BytesIO(), "foo")
+
+
+class TestCheckCompressionAvailable(object):
+    """
+    Tests for the check of the python modules required by each compression
+    """
+
+    @pytest.mark.parametrize(
+        ("compression", "import_function"),
+        (
+            ("snappy", "_try_import_snappy"),
+            ("snappy-raw", "_try_import_snappy"),
+            ("zstd", "_try_import_zstd"),
+            ("lz4", "_try_import_lz4"),
+        ),
+    )
+    def test_missing_module(self, compression, import_function):
+        """
+        Verifies a missing module is reported for the compression requiring it.
+        """
+        with mock.patch(
+            "barman.clients.cloud_compression.%s" % import_function,
+            side_effect=SystemExit("Missing required python module"),
+        ):
+            with pytest.raises(SystemExit, match="Missing required python module"):
+                check_compression_available(compression)
+
+    @pytest.mark.parametrize("compression", (None, "bzip2", "gzip", "xz"))
+    def test_builtin_compression(self, compression):
+        """
+        Verifies no check is required for compressions built into python.
+        """
+        check_compression_available(compression)
+
+
+class TestPickZstdLevel(object):
+    """
+    Tests for the choice of the zstd compression level
+    """
+
+    @pytest.mark.parametrize(
+        ("content", "expected_level"),
+        (
+            # Random data cannot be compressed, so the fastest level is used
+            (
+                random.Random(0)
+                .getrandbits(8 * ZSTD_SAMPLE_SIZE)
+                .to_bytes(ZSTD_SAMPLE_SIZE, "little"),
+                1,
+            ),
+            # Highly repetitive data keeps the default level
+            (b"0123456789" * ZSTD_SAMPLE_SIZE, ZSTD_LEVEL),
+            # An empty file keeps the default level
+            (b"", ZSTD_LEVEL),
+        ),
+        ids=("incompressible", "repetitive", "empty"),
+    )
+    def test_pick_zstd_level(self, content, expected_level):
+        """
+        Verifies the level is chosen from the compressibility of the sample and
+        that the file position is restored.
+        """
+        wal_file = BytesIO(content)
+
+        assert _pick_zstd_level(wal_file) == expected_level
+        assert wal_file.tell() == 0
+
+    def test_pick_zstd_level_not_seekable(self):
+        """
+        Verifies the default level is used when the file cannot be rewound.
+        """
+
+        class NotSeekable(object):
+            def tell(self):
+                raise OSError("Illegal seek")
+
+        assert _pick_zstd_level(NotSeekable()) == ZSTD_LEVEL
+
+
+class TestLoadZstdDictionary(object):
+    """
+    Tests for the loading of zstd dictionaries
+    """
+
+    def test_load_zstd_dictionary(self, tmpdir):
+        """
+        Verifies a dictionary loaded from a file can be used to compress and
+        decompress data.
+        """
+        # GIVEN a file containing a raw content dictionary
+        dictionary_file = tmpdir.join("wal.dict")
+        dictionary_file.write(b"some WAL content " * 64, mode="wb")
+        # WHEN it is loaded
+        zstd_dictionary = load_zstd_dictionary(dictionary_file.strpath)
+        # THEN it holds the content of the file
+        assert zstd_dictionary.as_bytes() == b"some WAL content " * 64
+        # AND data compressed with it is restored using the same dictionary
+        compressed_file = BytesIO()
+        compress_to(
+            BytesIO(b"some WAL content"), compressed_file, "zstd", zstd_dictionary
+        )
+        compressed_file.seek(0)
+        dest_file = BytesIO()
+        decompress_to_file(compressed_file, dest_file, "zstd", zstd_dictionary)
+        assert dest_file.getvalue() == b"some WAL content"
+
+    def test_load_zstd_dictionary_missing_file(self, tmpdir):
+        """
+        Verifies a missing dictionary file is reported.
+        """
+        with pytest.raises(IOError):
+            load_zstd_dictionary(tmpdir.join("missing.dict").strpath)
@@ -21,6 +21,7 @@ import io
 import os
 import tarfile
 
+import lz4.frame
 import mock
 import pytest
 from testing_helpers import build_mocked_server, get_compression_config
@@ -464,6 +465,9 @@ class TestInternalCompressors(object):
 
         compressor.compress(src.strpath, LZ4_FILE % tmpdir.strpath)
         assert os.path.exists(LZ4_FILE % tmpdir.strpath)
+        with open(LZ4_FILE % tmpdir.strpath, "rb") as lz4_file:
+            frame_info = lz4.frame.get_frame_info(lz4_file.read())
+        assert frame_info["block_size"] == 4 << 20
         compression_found = compression_manager.identify_compression(
             LZ4_FILE % tmpdir.strpath,
         )